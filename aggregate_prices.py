@@ -1,27 +1,589 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import argparse
 import glob
+import hashlib
+import math
 import os
+import pickle
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# openpyxl options for .xlsx: stream rows instead of building the full
+# workbook in memory, and take cached cell values instead of formulas.
+OPENPYXL_READ_KWARGS = {'read_only': True, 'data_only': True}
+
+# Parsed price list files are cached in this subdirectory of the price list
+# directory, one Parquet file per input file, so the cache does not depend on
+# the working directory. Bump CACHE_VERSION whenever the way a file is parsed
+# changes.
+CACHE_DIR = '.cache'
+CACHE_VERSION = 3
+
+# Columns repeating one value per sheet, stored dictionary encoded
+CATEGORY_COLUMNS = ['source_file', 'sheet_name']
+
+# Rows per batch when exporting the aggregate to CSV or Excel. Row groups
+# hold one price list file each and are merged into batches, since the
+# per-column overhead of small frames would dominate the export.
+EXPORT_BATCH_ROWS = 100_000
+
+# Prefix of the lowercase copies of text columns stored in the Parquet file
+LOWERCASE_PREFIX = '_lc_'
+
+# Search index tokens are runs of letters, digits and underscores (RE2 syntax)
+TOKEN_SEPARATOR = r'[^\pL\pN_]+'
 
 def check_dependencies():
     """Checks for required libraries and provides installation instructions."""
     try:
         import openpyxl
+        import pyarrow
+        import python_calamine
         import xlrd
     except ImportError as e:
         print(f"Error: Missing required library. Please install it.")
         print(f"Details: {e}")
         print("\nPlease run the following command to install the necessary libraries:")
-        print("pip install pandas openpyxl xlrd")
+        print("pip install pandas openpyxl pyarrow python-calamine xlrd")
         sys.exit(1)
 
-def aggregate_price_lists(price_dir, output_file):
+def open_excel_file(path):
+    """
+    Opens an Excel file with the engine suited to its format.
+
+    Args:
+        path (str): The path to the Excel file.
+
+    Returns:
+        pd.ExcelFile: The opened workbook.
+    """
+    if path.lower().endswith('.xls'):
+        # Legacy binary format is only supported by xlrd
+        return pd.ExcelFile(path, engine='xlrd')
+
+    try:
+        # calamine parses the workbook XML in Rust, without creating
+        # a Python object per cell like openpyxl does
+        return pd.ExcelFile(path, engine='calamine')
+    except Exception as e:
+        print(f"  ...calamine could not open the file ({e}). Retrying with openpyxl.")
+
+    try:
+        return pd.ExcelFile(path, engine='openpyxl', engine_kwargs=OPENPYXL_READ_KWARGS)
+    except Exception as e:
+        print(f"  ...Read-only mode failed ({e}). Retrying with default options.")
+        return pd.ExcelFile(path, engine='openpyxl')
+
+def _cache_path(path):
+    """
+    Returns the cache file for a price list file.
+
+    The cache key changes whenever the file is modified, so stale entries
+    are never read.
+
+    Args:
+        path (str): The path to the price list file.
+
+    Returns:
+        str: The path to the cached Parquet file.
+    """
+    stat = os.stat(path)
+    key_source = f"{CACHE_VERSION}|{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+    key = hashlib.blake2b(key_source.encode(), digest_size=16).hexdigest()
+    return os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR, f"{key}.parquet")
+
+def _prune_cache(price_dir, cache_paths):
     """
-    Aggregates all Excel price lists from a directory into a single Excel file.
+    Deletes cached files that no current price list file maps to.
+
+    Every edited or removed price list leaves its old cache entry behind,
+    so without pruning the cache would only grow.
 
     Args:
         price_dir (str): The directory containing the price list files.
-        output_file (str): The path to the output aggregated Excel file.
+        cache_paths (list[str]): The cache files used by the current run.
+    """
+    in_use = {os.path.abspath(path) for path in cache_paths}
+    stale = [
+        path for path in glob.glob(os.path.join(os.path.abspath(price_dir), CACHE_DIR, '*.parquet'))
+        if path not in in_use
+    ]
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"  ...Could not remove the stale cache file {path}. Error: {e}")
+    if stale:
+        print(f"Removed {len(stale)} stale cache files.")
+
+def _cache_one_file(path):
+    """
+    Parses a single price list file into the on-disk cache, unless it is cached already.
+
+    If the cache cannot be written, for example because the price list
+    directory is read-only, the parsed rows go to a temporary file instead,
+    so no file that was read is left out of the aggregate.
+
+    Args:
+        path (str): The path to the price list file.
+
+    Returns:
+        tuple[str, bool] or None: The path to the Parquet file holding the
+            parsed rows and whether it is a temporary file, or None if
+            nothing could be read from the file.
+    """
+    cache_path = _cache_path(path)
+    if os.path.exists(cache_path):
+        try:
+            pq.read_schema(cache_path)
+            print(f"Using cached file: {os.path.basename(path)}...")
+            return cache_path, False
+        except Exception as e:
+            print(f"  ...Could not read the cache for {os.path.basename(path)}. Error: {e}")
+
+    file_data = _read_sheets(path)
+    if not file_data:
+        return None
+
+    df = prepare_for_parquet(pd.concat(file_data, ignore_index=True, sort=False))
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        df.to_parquet(cache_path, index=False, compression='zstd')
+    except Exception as e:
+        print(f"  ...Could not write the cache for {os.path.basename(path)}. Error: {e}")
+    else:
+        return cache_path, False
+
+    fd, temp_path = tempfile.mkstemp(suffix='.parquet')
+    os.close(fd)
+    try:
+        df.to_parquet(temp_path, index=False, compression='zstd')
+    except Exception as e:
+        print(f"  ...Could not write the parsed rows of {os.path.basename(path)}. Error: {e}")
+        os.remove(temp_path)
+        return None
+    return temp_path, True
+
+def _is_data_sheet(xls, sheet_name):
+    """
+    Tells whether a sheet may hold table rows, without parsing its cells.
+
+    Only information the engine has already loaded is used: xlrd knows the
+    row count of every sheet, and calamine knows the sheet types, so chart
+    and macro sheets can be told apart from worksheets. openpyxl read-only
+    dimensions are not reliable, so such sheets are always parsed.
+
+    Args:
+        xls (pd.ExcelFile): The opened workbook.
+        sheet_name (str): The name of the sheet.
+
+    Returns:
+        bool: False if the sheet certainly has no rows below the header.
+    """
+    if xls.engine == 'xlrd':
+        return xls.book.sheet_by_name(sheet_name).nrows >= 2
+    if xls.engine == 'calamine':
+        from python_calamine import SheetTypeEnum
+        for sheet in xls.book.sheets_metadata:
+            if sheet.name == sheet_name:
+                return sheet.typ == SheetTypeEnum.WorkSheet
+    return True
+
+def _read_sheets(path):
+    """
+    Reads every non-empty sheet of a single price list file.
+
+    Args:
+        path (str): The path to the price list file.
+
+    Returns:
+        list[pd.DataFrame]: One dataframe per sheet, with the source columns added.
+    """
+    file_data = []
+    print(f"Processing file: {os.path.basename(path)}...")
+    try:
+        # Load the Excel file without assuming any sheet names
+        xls = open_excel_file(path)
+        for sheet_name in xls.sheet_names:
+            print(f"  - Reading sheet: '{sheet_name}'")
+            if not _is_data_sheet(xls, sheet_name):
+                print(f"    ...Sheet has no table rows. Skipping.")
+                continue
+            try:
+                df = pd.read_excel(xls, sheet_name=sheet_name)
+
+                if df.empty:
+                    print(f"    ...Sheet is empty. Skipping.")
+                    continue
+                
+                # Add the source information in front, as per methodology,
+                # so the combined dataframe needs no column reordering.
+                # Use the index as the original row number (plus 2 for header and 0-based index)
+                df.insert(0, 'row_number', df.index + 2)
+                df.insert(0, 'sheet_name', sheet_name)
+                df.insert(0, 'source_file', os.path.basename(path))
+
+                file_data.append(df)
+            except Exception as e:
+                print(f"    ...Could not read sheet '{sheet_name}'. Error: {e}")
+    except Exception as e:
+        print(f"Could not process file {os.path.basename(path)}. Error: {e}")
+    return file_data
+
+def prepare_for_parquet(df):
+    """
+    Makes a dataframe storable as Parquet.
+
+    Excel sheets often mix numbers and text in one column, which Arrow cannot
+    store in a single typed column. Such columns are converted to strings,
+    keeping empty cells as missing values. Column names are converted to
+    strings as well, since headers may be numeric.
+
+    Args:
+        df (pd.DataFrame): The aggregated dataframe.
+
+    Returns:
+        pd.DataFrame: A dataframe that can be written with to_parquet.
+    """
+    df = df.rename(columns=str)
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].astype('string')
+    return df
+
+def as_arrow_strings(col):
+    """
+    Returns the values of a column as an Arrow string array.
+
+    String columns are passed to Arrow as is. Other columns are formatted
+    with Python's str() first, so numbers match the way they are printed.
+
+    Args:
+        col (pd.Series): A column of the aggregated price list.
+
+    Returns:
+        pa.Array: The column values as strings, with missing values as nulls.
+    """
+    if pd.api.types.is_string_dtype(col.dtype) and col.dtype != object:
+        return pa.array(col, from_pandas=True)
+    return pa.array(col.astype(str), type=pa.string())
+
+def index_path(parquet_file):
+    """Returns the path of the search index stored next to a Parquet aggregate."""
+    return os.path.splitext(parquet_file)[0] + '.idx.pkl'
+
+def build_search_index(parquet_file):
+    """
+    Builds an inverted index from lowercase tokens to the rows containing them.
+
+    The tokens are taken from the same strings the search script matches,
+    so every row matching a query is found among the rows of the tokens
+    that contain the query's tokens. The aggregate is read one column at
+    a time, and columns without values are skipped.
+
+    Args:
+        parquet_file (str): The path to the aggregated Parquet file.
+
+    Returns:
+        dict: The vocabulary as a sorted Arrow string array, and the postings
+            as row numbers in CSR layout ('offsets' into 'rows').
+    """
+    postings = []
+    parquet = pq.ParquetFile(parquet_file)
+    names = parquet.schema_arrow.names
+    for col in names:
+        if col.startswith(LOWERCASE_PREFIX):
+            continue
+        lowercase_col = LOWERCASE_PREFIX + col
+        source_col = lowercase_col if lowercase_col in names else col
+        table = parquet.read(columns=[source_col])
+        if table[source_col].null_count == table.num_rows:
+            continue
+        # Convert with the same types the search script uses
+        values = table.to_pandas(types_mapper=pd.ArrowDtype)[source_col]
+        strings = as_arrow_strings(values)
+        if source_col == col:
+            strings = pc.utf8_lower(strings)
+        parts = pc.split_pattern_regex(strings, TOKEN_SEPARATOR)
+        postings.append(pa.table({
+            'token': pc.list_flatten(parts),
+            'row': pc.cast(pc.list_parent_indices(parts), pa.int32()),
+        }))
+
+    # Deduplicate and sort the postings in Arrow, without a Python string per token
+    schema = pa.schema([('token', pa.string()), ('row', pa.int32())])
+    postings = pa.concat_tables(postings) if postings else schema.empty_table()
+    postings = postings.filter(pc.not_equal(postings['token'], ''))
+    postings = postings.group_by(['token', 'row']).aggregate([])
+    postings = postings.sort_by([('token', 'ascending'), ('row', 'ascending')])
+
+    tokens = postings['token'].combine_chunks()
+    # Postings are sorted by token, so each token starts where it differs from the previous one
+    is_new_token = pc.not_equal(tokens[1:], tokens[:-1]).to_numpy(zero_copy_only=False)
+    starts = np.flatnonzero(np.r_[True, is_new_token]) if len(tokens) else np.array([], dtype=np.int64)
+    return {
+        'n_rows': parquet.metadata.num_rows,
+        'tokens': tokens.take(starts),
+        'offsets': np.append(starts, len(tokens)).astype(np.int64),
+        'rows': postings['row'].to_numpy(),
+    }
+
+def _is_text_type(arrow_type):
+    """Tells whether an Arrow type holds text, plain or dictionary encoded."""
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+
+def _smallest_integer_type(low, high):
+    """Returns the smallest signed integer type holding the range, like pd.to_numeric(downcast='integer')."""
+    for arrow_type in (pa.int8(), pa.int16(), pa.int32()):
+        info = np.iinfo(arrow_type.to_pandas_dtype())
+        if low is None or (info.min <= low and high <= info.max):
+            return arrow_type
+    return pa.int64()
+
+def _finest_unit(arrow_types):
+    """Returns the finest time unit among timestamp or duration types."""
+    units = ['s', 'ms', 'us', 'ns']
+    return max((arrow_type.unit for arrow_type in arrow_types), key=units.index)
+
+def _concat_type(file_types, has_missing):
+    """
+    Returns the type of a column in the aggregate, from its type in each file.
+
+    These are the promotion rules of the aggregate. They follow what
+    concatenating the files with pandas gives:
+
+    - no values in any file: float64, as pandas pads missing columns with NaN
+    - text in every file: string
+    - booleans only: bool
+    - numbers: NumPy's promoted type, and float64 for integers when some
+      file lacks values, since NaN needs a float. Booleans mixed with
+      integers are read as 0 and 1, but only without missing values and
+      floats; otherwise the mix is text.
+    - timestamps: the finest unit of the files. When the time zones differ,
+      or only some files have one, the values are stored in UTC, with naive
+      values read as UTC.
+    - durations: the finest unit of the files
+    - the same other type in every file: that type
+    - anything else: string, with every value formatted by str() as pandas
+      formats object columns (see _format_as_text). This includes
+      timestamps mixed with numbers, which pandas would reinterpret as
+      offsets from the epoch.
+
+    Args:
+        file_types (list[pa.DataType]): The non-null types of the column in the files having it.
+        has_missing (bool): Whether some file lacks the column or holds no values in it.
+
+    Returns:
+        pa.DataType: The type of the column in the aggregate.
+    """
+    kinds = set(file_types)
+    if not kinds:
+        return pa.float64()
+    if all(_is_text_type(arrow_type) for arrow_type in kinds):
+        return pa.string()
+    if all(pa.types.is_boolean(arrow_type) for arrow_type in kinds):
+        return pa.bool_()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_boolean(t) for t in kinds):
+        numbers = [arrow_type for arrow_type in kinds if not pa.types.is_boolean(arrow_type)]
+        if len(numbers) < len(kinds) and (has_missing or any(pa.types.is_floating(t) for t in numbers)):
+            return pa.string()
+        promoted = pa.from_numpy_dtype(np.result_type(*[arrow_type.to_pandas_dtype() for arrow_type in numbers]))
+        return pa.float64() if pa.types.is_integer(promoted) and has_missing else promoted
+    if all(pa.types.is_timestamp(arrow_type) for arrow_type in kinds):
+        zones = {arrow_type.tz for arrow_type in kinds}
+        return pa.timestamp(_finest_unit(kinds), zones.pop() if len(zones) == 1 else 'UTC')
+    if all(pa.types.is_duration(arrow_type) for arrow_type in kinds):
+        return pa.duration(_finest_unit(kinds))
+    if len(kinds) == 1:
+        return kinds.pop()
+    return pa.string()
+
+def _format_as_text(col):
+    """Formats the values of a non-text column with str(), keeping nulls."""
+    values = col.to_pandas(types_mapper=pd.ArrowDtype).astype(object)
+    return pa.array(values.map(str, na_action='ignore'), type=pa.string(), from_pandas=True)
+
+def unified_schema(cache_paths):
+    """
+    Chooses one Arrow type per column of the aggregate.
+
+    Column types follow the promotion rules of _concat_type, except that
+    source_file and sheet_name are dictionary encoded. Integer columns are
+    then downcast to the smallest type that holds their values, and float
+    columns to float32 only when every value survives the round trip, so
+    prices keep their printed form.
+
+    Args:
+        cache_paths (list[str]): The cached Parquet files, in output order.
+
+    Returns:
+        pa.Schema: The schema of the aggregate, without the lowercase columns.
+    """
+    schemas = [pq.read_schema(path) for path in cache_paths]
+    columns = list(dict.fromkeys(name for schema in schemas for name in schema.names))
+
+    types = {}
+    for name in columns:
+        file_types = [schema.field(name).type for schema in schemas if name in schema.names]
+        value_types = [arrow_type for arrow_type in file_types if not pa.types.is_null(arrow_type)]
+        has_missing = len(value_types) < len(schemas)
+        if name in CATEGORY_COLUMNS:
+            types[name] = pa.dictionary(pa.int32(), pa.string())
+        else:
+            types[name] = _concat_type(value_types, has_missing)
+
+    # Downcast numeric columns, reading only those columns from each file
+    ranges = {name: (None, None) for name, arrow_type in types.items() if pa.types.is_integer(arrow_type)}
+    float32_exact = {name: True for name, arrow_type in types.items() if pa.types.is_floating(arrow_type)}
+    for path, schema in zip(cache_paths, schemas):
+        present = [name for name in schema.names if name in ranges or name in float32_exact]
+        table = pq.read_table(path, columns=present)
+        for name in present:
+            if name in ranges:
+                bounds = pc.min_max(table[name]).as_py()
+                low, high = ranges[name]
+                if bounds['min'] is not None:
+                    ranges[name] = (
+                        bounds['min'] if low is None else min(low, bounds['min']),
+                        bounds['max'] if high is None else max(high, bounds['max']),
+                    )
+            elif float32_exact[name] and not pa.types.is_null(table[name].type):
+                values = pc.cast(table[name], pa.float64())
+                round_trip = pc.cast(pc.cast(values, pa.float32(), safe=False), pa.float64())
+                float32_exact[name] = pc.all(pc.equal(round_trip, values)).as_py() is not False
+    for name, (low, high) in ranges.items():
+        types[name] = _smallest_integer_type(low, high)
+    for name, exact in float32_exact.items():
+        if exact:
+            types[name] = pa.float32()
+
+    return pa.schema([pa.field(name, types[name]) for name in columns])
+
+def with_lowercase_fields(schema):
+    """Returns the schema extended with a lowercase copy of every text column."""
+    lowercase_fields = [
+        pa.field(LOWERCASE_PREFIX + field.name, field.type)
+        for field in schema
+        if _is_text_type(field.type)
+    ]
+    return pa.schema(list(schema) + lowercase_fields)
+
+def conform_table(table, schema):
+    """
+    Converts one cached file to the schema of the aggregate.
+
+    Missing columns are filled with nulls, and the other columns are cast
+    to the types chosen by unified_schema. A
+    lowercase copy of every text column is appended. The search script
+    matches against these copies, so the case folding is done once here
+    instead of on every query.
+
+    Args:
+        table (pa.Table): The rows of one cached file.
+        schema (pa.Schema): The schema returned by unified_schema.
+
+    Returns:
+        pa.Table: The rows in the schema returned by with_lowercase_fields.
+    """
+    columns = []
+    for field in schema:
+        if field.name not in table.column_names:
+            columns.append(pa.nulls(table.num_rows, field.type))
+            continue
+        col = table[field.name]
+        if col.type == field.type:
+            columns.append(col)
+        elif pa.types.is_dictionary(field.type):
+            columns.append(pc.cast(col, pa.string()).dictionary_encode())
+        elif pa.types.is_string(field.type) and not _is_text_type(col.type):
+            columns.append(_format_as_text(col))
+        else:
+            # Promotions follow _concat_type, and downcasts were checked
+            # against the values by unified_schema
+            columns.append(pc.cast(col, field.type, safe=False))
+
+    for field, col in list(zip(schema, columns)):
+        if pa.types.is_dictionary(field.type):
+            columns.append(pc.utf8_lower(pc.cast(col, pa.string())).dictionary_encode())
+        elif _is_text_type(field.type):
+            columns.append(pc.utf8_lower(col))
+    return pa.Table.from_arrays(columns, schema=with_lowercase_fields(schema))
+
+def _iter_batches(parquet_file):
+    """Yields the aggregate as dataframes of up to EXPORT_BATCH_ROWS rows, without the lowercase columns."""
+    parquet = pq.ParquetFile(parquet_file)
+    columns = [name for name in parquet.schema_arrow.names if not name.startswith(LOWERCASE_PREFIX)]
+    for batch in parquet.iter_batches(batch_size=EXPORT_BATCH_ROWS, columns=columns):
+        yield batch.to_pandas()
+
+def write_csv_copy(parquet_file, csv_file):
+    """Writes the aggregate to a CSV file, one batch of rows at a time."""
+    # The BOM lets Excel detect UTF-8 and show Cyrillic text correctly
+    with open(csv_file, 'w', encoding='utf-8-sig', newline='') as f:
+        for i, df in enumerate(_iter_batches(parquet_file)):
+            df.to_csv(f, index=False, header=(i == 0))
+
+def _restore_number(value):
+    """
+    Returns the number a text cell holds, or the text itself.
+
+    Only text that is exactly how Python prints the number is converted,
+    which is how numbers from mixed number/text columns were stored.
+    Text such as article numbers with leading zeros stays text.
+
+    Args:
+        value (str): The text of a cell.
+
+    Returns:
+        int, float or str: The number, or the text if it is not one.
+    """
+    for parse in (int, float):
+        try:
+            number = parse(value)
+        except ValueError:
+            continue
+        if str(number) == value and math.isfinite(number):
+            return number
+    return value
+
+def write_xlsx_copy(parquet_file, xlsx_file):
+    """
+    Writes the aggregate to an Excel file, one batch of rows at a time.
+
+    Columns mixing numbers and text are stored as text in the aggregate.
+    The numbers are written back as numbers, so they can be summed and
+    sorted in Excel.
+
+    Args:
+        parquet_file (str): The path to the aggregated Parquet file.
+        xlsx_file (str): The path to the Excel file to write.
+    """
+    with pd.ExcelWriter(xlsx_file) as writer:
+        start_row = 0
+        for df in _iter_batches(parquet_file):
+            for col in df.columns[[pd.api.types.is_string_dtype(dtype) for dtype in df.dtypes]]:
+                df[col] = df[col].astype(object).map(_restore_number, na_action='ignore')
+            df.to_excel(writer, index=False, header=(start_row == 0), startrow=start_row + (start_row > 0))
+            start_row += len(df)
+
+def aggregate_price_lists(price_dir, output_file, write_csv=True, write_xlsx=False):
+    """
+    Aggregates all Excel price lists from a directory into a single Parquet file.
+
+    Args:
+        price_dir (str): The directory containing the price list files.
+        output_file (str): The path to the output aggregated Parquet file.
+        write_csv (bool): Also write a CSV copy next to the Parquet file.
+        write_xlsx (bool): Also write an Excel copy next to the Parquet file.
     """
     check_dependencies()
 
@@ -42,71 +604,78 @@ def aggregate_price_lists(price_dir, output_file):
 
     print(f"Found {len(all_files)} price list files to process...")
 
-    all_data = []
+    # Each file is parsed independently, so spread them across processes.
+    # Workers only hand back the path of the cached file, so the parsed
+    # rows are never all held in memory at once.
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = [result for result in executor.map(_cache_one_file, all_files) if result]
+    cache_paths = [path for path, _ in results]
+    temp_paths = [path for path, is_temporary in results if is_temporary]
+    _prune_cache(price_dir, cache_paths)
 
-    for f in all_files:
-        print(f"Processing file: {os.path.basename(f)}...")
-        try:
-            # Load the Excel file without assuming any sheet names
-            xls = pd.ExcelFile(f)
-            for sheet_name in xls.sheet_names:
-                print(f"  - Reading sheet: '{sheet_name}'")
-                try:
-                    df = pd.read_excel(xls, sheet_name=sheet_name)
-
-                    if df.empty:
-                        print(f"    ...Sheet is empty. Skipping.")
-                        continue
-                    
-                    # Add the source information
-                    df['source_file'] = os.path.basename(f)
-                    df['sheet_name'] = sheet_name
-                    # Use the index as the original row number (plus 2 for header and 0-based index)
-                    df['row_number'] = df.index + 2 
-
-                    all_data.append(df)
-                except Exception as e:
-                    print(f"    ...Could not read sheet '{sheet_name}'. Error: {e}")
-        except Exception as e:
-            print(f"Could not process file {os.path.basename(f)}. Error: {e}")
-
-    if not all_data:
+    if not cache_paths:
         print("No data was extracted from any of the files.")
         return
 
-    print("Combining all dataframes...")
-    # Concatenate all dataframes, trying to align columns
-    # Using outer join to keep all columns from all files
-    aggregated_df = pd.concat(all_data, ignore_index=True, sort=False)
-    
-    # Reorder columns to have the source info first, as per methodology
-    cols = aggregated_df.columns.tolist()
-    source_cols = ['source_file', 'sheet_name', 'row_number']
-    
-    # Remove the source columns from their current position
-    for col in source_cols:
-        if col in cols:
-            cols.remove(col)
-            
-    # Add them to the beginning
-    final_cols = source_cols + cols
-    aggregated_df = aggregated_df[final_cols]
-    
+    print("Combining all files...")
+    schema = unified_schema(cache_paths)
+
     print(f"Writing aggregated data to '{output_file}'...")
+    total_rows = 0
+    partial_file = output_file + '.partial'
     try:
-        aggregated_df.to_excel(output_file, index=False)
-        print("Aggregation complete!")
-        print(f"A total of {len(aggregated_df)} rows have been written.")
+        # Stream the files into the aggregate one at a time, one row group each
+        with pq.ParquetWriter(partial_file, with_lowercase_fields(schema), compression='zstd') as writer:
+            for path in cache_paths:
+                table = conform_table(pq.read_table(path), schema)
+                writer.write_table(table)
+                total_rows += table.num_rows
+        os.replace(partial_file, output_file)
     except Exception as e:
-        print(f"Failed to write to Excel file. Error: {e}")
+        print(f"Failed to write to Parquet file. Error: {e}")
+        return
+    finally:
+        for path in temp_paths:
+            os.remove(path)
+
+    print(f"Writing search index to '{index_path(output_file)}'...")
+    try:
+        with open(index_path(output_file), 'wb') as f:
+            pickle.dump(build_search_index(output_file), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        print(f"Failed to write the search index. Error: {e}")
+
+    if write_csv:
+        csv_file = os.path.splitext(output_file)[0] + '.csv'
+        print(f"Writing CSV copy to '{csv_file}'...")
+        try:
+            write_csv_copy(output_file, csv_file)
+        except Exception as e:
+            print(f"Failed to write to CSV file. Error: {e}")
+
+    if write_xlsx:
+        xlsx_file = os.path.splitext(output_file)[0] + '.xlsx'
+        print(f"Writing Excel copy to '{xlsx_file}'...")
+        try:
+            write_xlsx_copy(output_file, xlsx_file)
+        except Exception as e:
+            print(f"Failed to write to Excel file. Error: {e}")
+
+    print("Aggregation complete!")
+    print(f"A total of {total_rows} rows have been written.")
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Aggregate all price lists into a single file.")
+    parser.add_argument('--no-csv', action='store_true', help="do not write the CSV copy of the aggregate")
+    parser.add_argument('--xlsx', action='store_true', help="also write the aggregate as an Excel file (slow)")
+    args = parser.parse_args()
+
     PRICE_DIR = 'Прайсы'
-    OUTPUT_FILE = 'aggregated_pricelist.xlsx'
+    OUTPUT_FILE = 'aggregated_pricelist.parquet'
     
     if not os.path.isdir(PRICE_DIR):
         print(f"Error: The price directory '{PRICE_DIR}' does not exist.")
         sys.exit(1)
         
-    aggregate_price_lists(PRICE_DIR, OUTPUT_FILE)
\ No newline at end of file
+    aggregate_price_lists(PRICE_DIR, OUTPUT_FILE, write_csv=not args.no_csv, write_xlsx=args.xlsx)
\ No newline at end of file
@@ -1,7 +1,89 @@
 
+import numpy as np
 import pandas as pd
-import sys
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import os
+import pickle
+import sys
+
+from aggregate_prices import LOWERCASE_PREFIX, TOKEN_SEPARATOR, as_arrow_strings, index_path
+
+def _load_search_index(search_file, n_rows):
+    """
+    Loads the search index stored next to a Parquet aggregate.
+
+    Args:
+        search_file (str): The path to the aggregated Parquet file.
+        n_rows (int): The number of rows in the aggregate.
+
+    Returns:
+        dict or None: The index, or None if it is missing or out of date.
+    """
+    path = index_path(search_file)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(search_file):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            index = pickle.load(f)
+    except Exception as e:
+        print(f"Could not read the search index, scanning all rows. Error: {e}")
+        return None
+    return index if index['n_rows'] == n_rows else None
+
+def _index_candidates(index, lowercase_query):
+    """
+    Finds the rows that may contain the query, using the search index.
+
+    A row can only contain the query if, for every token of the query, it
+    contains a token that includes it. The vocabulary is much smaller than
+    the price list, so it is scanned instead of the rows.
+
+    Args:
+        index (dict): The index built by build_search_index.
+        lowercase_query (str): The lowercased search term.
+
+    Returns:
+        np.ndarray or None: Sorted candidate row numbers, or None if the
+            query has no tokens and all rows have to be scanned.
+    """
+    parts = pc.split_pattern_regex(pa.array([lowercase_query]), TOKEN_SEPARATOR)
+    query_tokens = {token for token in parts[0].as_py() if token}
+    if not query_tokens:
+        return None
+
+    offsets = index['offsets']
+    candidates = None
+    for token in query_tokens:
+        token_ids = np.flatnonzero(pc.match_substring(index['tokens'], token).to_numpy(zero_copy_only=False))
+        rows = np.unique(np.concatenate(
+            [index['rows'][offsets[i]:offsets[i + 1]] for i in token_ids] or [np.array([], dtype=np.int32)]
+        ))
+        candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+    return candidates
+
+def _read_rows(parquet, rows):
+    """
+    Reads the given rows of a Parquet file, decoding only the row groups holding them.
+
+    Args:
+        parquet (pq.ParquetFile): The opened aggregate.
+        rows (np.ndarray): Sorted row numbers.
+
+    Returns:
+        pa.Table: The rows, in order.
+    """
+    sizes = [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)]
+    starts = np.cumsum([0] + sizes)
+    row_groups = np.searchsorted(starts, rows, side='right') - 1
+    needed = np.unique(row_groups)
+    if len(needed) == 0:
+        return parquet.schema_arrow.empty_table()
+    # Where each needed row group starts in the table read from them
+    read_starts = np.cumsum([0] + [sizes[i] for i in needed[:-1]])
+    positions = rows - starts[row_groups] + read_starts[np.searchsorted(needed, row_groups)]
+    return parquet.read_row_groups(needed.tolist()).take(positions)
 
 def search_price_list(query, search_file):
     """
@@ -9,7 +91,7 @@ def search_price_list(query, search_file):
 
     Args:
         query (str): The search term.
-        search_file (str): The path to the aggregated Excel file.
+        search_file (str): The path to the aggregated Parquet or Excel file.
     """
     if not os.path.exists(search_file):
         print(f"Error: The aggregated price list file '{search_file}' was not found.")
@@ -18,53 +100,81 @@ def search_price_list(query, search_file):
 
     print(f"Searching for '{query}' in '{search_file}'...")
     
+    lowercase_query = query.lower()
     try:
-        df = pd.read_excel(search_file)
+        if search_file.endswith('.parquet'):
+            # Consult the search index first, so only the candidate rows are
+            # read and converted to pandas. Without an index, or for queries
+            # without tokens, all rows are scanned.
+            parquet = pq.ParquetFile(search_file)
+            index = _load_search_index(search_file, parquet.metadata.num_rows)
+            candidates = _index_candidates(index, lowercase_query) if index else None
+            table = parquet.read() if candidates is None else _read_rows(parquet, candidates)
+            df = table.to_pandas(types_mapper=pd.ArrowDtype)
+        else:
+            df = pd.read_excel(search_file)
     except Exception as e:
-        print(f"Error reading the Excel file: {e}")
+        print(f"Error reading the aggregated file: {e}")
         sys.exit(1)
 
-    # Perform a case-insensitive search across all columns
-    # We create a boolean mask for rows that contain the query in any cell
-    # NaNs are filled with empty strings to make them searchable
-    mask = df.apply(lambda col: col.astype(str).str.contains(query, case=False, na=False))
-    
-    # The result of the above is a DataFrame of booleans. We want rows where *any* column is True.
-    results_df = df[mask.any(axis=1)]
+    # The Parquet aggregate stores lowercase copies of the text columns.
+    # Set them aside so they are matched but never displayed.
+    lowercase_cols = [col for col in df.columns if str(col).startswith(LOWERCASE_PREFIX)]
+    lowercase_df = df[lowercase_cols]
+    df = df.drop(columns=lowercase_cols)
+
+    # Perform a case-insensitive literal search across all columns.
+    # Each column is scanned once in Arrow; the per-column result is kept
+    # to decide which columns to display.
+    hit = np.zeros(len(df), dtype=bool)
+    col_hit = {}
+    for col in df.columns:
+        lowercase_col = f"{LOWERCASE_PREFIX}{col}"
+        if lowercase_col in lowercase_df.columns:
+            col_mask = pc.match_substring(as_arrow_strings(lowercase_df[lowercase_col]), lowercase_query)
+        else:
+            col_mask = pc.match_substring(as_arrow_strings(df[col]), query, ignore_case=True)
+        col_mask = col_mask.fill_null(False).to_numpy(zero_copy_only=False)
+        col_hit[col] = col_mask.any()
+        if col_hit[col]:
+            hit |= col_mask
 
-    if results_df.empty:
+    hits = np.flatnonzero(hit)
+
+    if len(hits) == 0:
         print("No results found.")
     else:
-        print(f"Found {len(results_df)} matching rows:")
+        print(f"Found {len(hits)} matching rows:")
         
         # Determine which columns to display.
         # We'll show the source columns and any column that contains the match.
         source_cols = ['source_file', 'sheet_name', 'row_number']
         display_cols = set(source_cols)
-        
-        # Find columns that have the query string
-        for col in results_df.columns:
-            if results_df[col].astype(str).str.contains(query, case=False, na=False).any():
-                display_cols.add(col)
+        display_cols.update(col for col, matched in col_hit.items() if matched)
         
         # Ensure the columns are in a logical order
-        final_display_cols = source_cols + sorted(list(display_cols - set(source_cols)))
+        detail_cols = sorted(list(display_cols - set(source_cols)))
+        final_display_cols = source_cols + detail_cols
+
+        # Only the matching rows and displayed columns are materialized
+        records = df.iloc[hits][final_display_cols].to_dict(orient='records')
         
         # To avoid printing a very wide dataframe, let's just print the relevant info
-        # in a more readable, non-tabular format for each row.
-        for index, row in results_df.iterrows():
-            print("-" * 50)
-            print(f"Match found in: {row['source_file']}, Sheet: '{row['sheet_name']}', Row: {row['row_number']}")
-            print("Details:")
-            for col in final_display_cols:
-                # Don't print the source info again
-                if col in source_cols:
-                    continue
-                
-                # Check if the value is not null/empty
-                if pd.notna(row[col]):
-                    print(f"  - {col}: {row[col]}")
-            print("-" * 50)
+        # in a more readable, non-tabular format for each row. The lines are
+        # collected first and written in one go.
+        lines = []
+        for record in records:
+            lines.append("-" * 50)
+            lines.append(f"Match found in: {record['source_file']}, Sheet: '{record['sheet_name']}', Row: {record['row_number']}")
+            lines.append("Details:")
+            for col in detail_cols:
+                value = record[col]
+                # Skip null/empty values (NaN is the only value not equal to itself)
+                if value is not None and value == value:
+                    lines.append(f"  - {col}: {value}")
+            lines.append("-" * 50)
+        if lines:
+            sys.stdout.write('\n'.join(lines) + '\n')
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
@@ -72,6 +182,9 @@ if __name__ == '__main__':
         sys.exit(1)
         
     search_query = sys.argv[1]
-    AGGREGATED_FILE = 'aggregated_pricelist.xlsx'
+    AGGREGATED_FILE = 'aggregated_pricelist.parquet'
+    # Fall back to the Excel aggregate produced by older versions of the script
+    if not os.path.exists(AGGREGATED_FILE) and os.path.exists('aggregated_pricelist.xlsx'):
+        AGGREGATED_FILE = 'aggregated_pricelist.xlsx'
     
     search_price_list(search_query, AGGREGATED_FILE)
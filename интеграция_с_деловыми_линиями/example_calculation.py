@@ -4,10 +4,14 @@
 Интеграция с методичкой расчета стоимости монтажных работ
 """
 
+import numpy as np
+import orjson
 import requests
-import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Ключ приложения Dellin
 APPKEY = "433D67A0-A9D1-4293-A14C-83329023A30F"
@@ -15,12 +19,33 @@ APPKEY = "433D67A0-A9D1-4293-A14C-83329023A30F"
 # Базовый URL API
 API_BASE_URL = "https://api.dellin.ru/v2/"
 
+# Таймауты запросов к API: (подключение, чтение) в секундах
+REQUEST_TIMEOUT = (3, 15)
+
+# Общая сессия для всех калькуляторов: соединения с API переиспользуются.
+# Методы API только читают данные, поэтому POST-запросы можно повторять.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["POST"],
+        # После исчерпания повторов вернуть последний ответ, чтобы
+        # raise_for_status() сработал и тело ошибки сервера попало в лог
+        raise_on_status=False,
+    ),
+))
+# Тела запросов сериализуются orjson, поэтому тип содержимого задается явно
+_SESSION.headers["Content-Type"] = "application/json"
+
 class DellinCalculator:
     """Класс для работы с API Dellin калькулятора стоимости доставки"""
     
     def __init__(self, appkey):
         self.appkey = appkey
-        self.session = requests.Session()
+        self.session = _SESSION
     
     def find_city(self, city_name):
         """
@@ -39,9 +64,9 @@ class DellinCalculator:
         }
         
         try:
-            response = self.session.post(url, json=payload)
+            response = self.session.post(url, data=orjson.dumps(payload), timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             
             if data.get("success") and data.get("cities"):
                 # Возвращаем первый найденный город
@@ -89,21 +114,6 @@ class DellinCalculator:
         """
         url = f"{API_BASE_URL}calculator.json"
         
-        # Определение варианта доставки
-        if terminal_from:
-            derival_variant = "terminal"
-            derival_terminal = terminal_from
-        else:
-            derival_variant = "address"
-            derival_address = address_from or ""
-        
-        if terminal_to:
-            arrival_variant = "terminal"
-            arrival_terminal = terminal_to
-        else:
-            arrival_variant = "address"
-            arrival_address = address_to or ""
-        
         # Вычисление объема из габаритов, если не указан
         if not volume_m3 and length_cm and width_cm and height_cm:
             volume_m3 = (length_cm * width_cm * height_cm) / 1_000_000  # м³
@@ -116,7 +126,8 @@ class DellinCalculator:
         if not delivery_date:
             delivery_date = (datetime.now() + timedelta(days=5)).strftime("%Y-%m-%d")
         
-        # Формирование запроса
+        # Формирование запроса: вариант доставки определяется наличием
+        # терминала, иначе передается адрес (если указан)
         payload = {
             "appkey": self.appkey,
             "delivery": {
@@ -124,50 +135,35 @@ class DellinCalculator:
                     "type": "auto"
                 },
                 "arrival": {
-                    "variant": arrival_variant,
-                    "produceDate": delivery_date
+                    "variant": "terminal" if terminal_to else "address",
+                    "produceDate": delivery_date,
+                    "city": to_city_code,
+                    **({"terminalID": terminal_to} if terminal_to else
+                       {"address": address_to} if address_to else {}),
                 },
                 "derival": {
-                    "variant": derival_variant,
-                    "produceDate": pickup_date
+                    "variant": "terminal" if terminal_from else "address",
+                    "produceDate": pickup_date,
+                    "city": from_city_code,
+                    **({"terminalID": terminal_from} if terminal_from else
+                       {"address": address_from} if address_from else {}),
                 }
             },
             "cargo": {
                 "quantity": 1,
                 "weight": weight_kg,
-                "totalWeight": weight_kg
+                "totalWeight": weight_kg,
+                **({"length": length_cm} if length_cm else {}),
+                **({"width": width_cm} if width_cm else {}),
+                **({"height": height_cm} if height_cm else {}),
+                **({"totalVolume": volume_m3} if volume_m3 else {}),
             }
         }
         
-        # Добавление параметров города
-        payload["delivery"]["arrival"]["city"] = to_city_code
-        payload["delivery"]["derival"]["city"] = from_city_code
-        
-        # Добавление габаритов
-        if length_cm:
-            payload["cargo"]["length"] = length_cm
-        if width_cm:
-            payload["cargo"]["width"] = width_cm
-        if height_cm:
-            payload["cargo"]["height"] = height_cm
-        if volume_m3:
-            payload["cargo"]["totalVolume"] = volume_m3
-        
-        # Добавление терминалов или адресов
-        if terminal_from:
-            payload["delivery"]["derival"]["terminalID"] = terminal_from
-        elif address_from:
-            payload["delivery"]["derival"]["address"] = address_from
-        
-        if terminal_to:
-            payload["delivery"]["arrival"]["terminalID"] = terminal_to
-        elif address_to:
-            payload["delivery"]["arrival"]["address"] = address_to
-        
         try:
-            response = self.session.post(url, json=payload)
+            response = self.session.post(url, data=orjson.dumps(payload), timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             
             return data
         except Exception as e:
@@ -191,9 +187,12 @@ def calculate_logistics_cost(equipment_list, from_city, to_city):
     """
     calculator = DellinCalculator(APPKEY)
     
-    # Поиск кодов городов
-    from_city_data = calculator.find_city(from_city)
-    to_city_data = calculator.find_city(to_city)
+    # Поиск кодов городов (запросы независимы, выполняются параллельно)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        from_city_future = executor.submit(calculator.find_city, from_city)
+        to_city_future = executor.submit(calculator.find_city, to_city)
+        from_city_data = from_city_future.result()
+        to_city_data = to_city_future.result()
     
     if not from_city_data or not to_city_data:
         return {
@@ -205,18 +204,23 @@ def calculate_logistics_cost(equipment_list, from_city, to_city):
     from_city_code = from_city_data["code"]
     to_city_code = to_city_data["code"]
     
-    # Суммарные параметры груза
-    total_weight = sum(eq.get("weight", 0) for eq in equipment_list)
-    total_volume = sum(
-        (eq.get("length", 0) * eq.get("width", 0) * eq.get("height", 0)) / 1_000_000
+    # Параметры оборудования одной матрицей: вес, длина, ширина, высота.
+    # Отсутствующий габарит равен 0, поэтому такая позиция не дает объема.
+    # Тип матрицы выводится из данных: если все значения целые, она
+    # целочисленная и итоги остаются целыми, как у sum()/max().
+    rows = [
+        [eq.get("weight", 0), eq.get("length", 0), eq.get("width", 0), eq.get("height", 0)]
         for eq in equipment_list
-        if all(k in eq for k in ["length", "width", "height"])
-    )
+    ]
+    params = np.array(rows, dtype=None if rows else np.int64).reshape(-1, 4)
+    
+    # Суммарные параметры груза
+    total_weight = params[:, 0].sum().item()
+    # Без позиций с полными габаритами объем равен целому 0, как у sum()
+    total_volume = (params[:, 1:].prod(axis=1) / 1_000_000).sum().item() or 0
     
     # Максимальные габариты
-    max_length = max((eq.get("length", 0) for eq in equipment_list), default=0)
-    max_width = max((eq.get("width", 0) for eq in equipment_list), default=0)
-    max_height = max((eq.get("height", 0) for eq in equipment_list), default=0)
+    max_length, max_width, max_height = params[:, 1:].max(axis=0, initial=0).tolist()
     
     # Расчет стоимости
     result = calculator.calculate_cost(
@@ -299,8 +303,9 @@ if __name__ == "__main__":
     
     # Сохранение результата в JSON
     output_file = Path(__file__).parent / "calculation_result.json"
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+    output_file.write_bytes(
+        orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS, default=str)
+    )
     
     print(f"Результат сохранен в: {output_file}")
 